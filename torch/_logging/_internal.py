@@ -5,7 +5,7 @@ import os
 import re
 from dataclasses import dataclass, field
 from importlib import __import__
-from typing import Dict, List, Optional, Set, Union
+from typing import Dict, FrozenSet, List, Optional, Set, Union
 from weakref import WeakSet
 
 log = logging.getLogger(__name__)
@@ -53,6 +53,10 @@ class LogRegistry:
     # logging format string for artifacts
     artifact_log_formatters: Dict[str, logging.Formatter] = field(default_factory=dict)
 
+    # cached flattened set of all registered log qnames,
+    # invalidated whenever register_log mutates the registry
+    _log_qnames_cache: Optional[FrozenSet[str]] = None
+
     def is_artifact(self, name):
         return name in self.artifact_names
 
@@ -64,6 +68,7 @@ class LogRegistry:
         if isinstance(log_qnames, str):
             log_qnames = [log_qnames]
         self.log_alias_to_log_qnames[alias] = log_qnames
+        self._log_qnames_cache = None
 
     # register an artifact name
     def register_artifact_name(
@@ -91,19 +96,15 @@ class LogRegistry:
     def register_child_log(self, log_qname):
         self.child_log_qnames.add(log_qname)
 
-    # flattens all the qnames together (TODO: consider memoizing?)
-    def get_log_qnames(self) -> Set[str]:
-        return {
-            qname
-            for qnames in self.log_alias_to_log_qnames.values()
-            for qname in qnames
-        }
-
-    def get_artifact_log_qnames(self):
-        return set(self.artifact_log_qnames)
-
-    def get_child_log_qnames(self):
-        return set(self.child_log_qnames)
+    # flattens all the qnames together, memoized until the next register_log
+    def get_log_qnames(self) -> FrozenSet[str]:
+        if self._log_qnames_cache is None:
+            self._log_qnames_cache = frozenset(
+                qname
+                for qnames in self.log_alias_to_log_qnames.values()
+                for qname in qnames
+            )
+        return self._log_qnames_cache
 
     def is_off_by_default(self, artifact_qname):
         return artifact_qname in self.off_by_default_artifact_names
@@ -469,11 +470,6 @@ def getArtifactLogger(module_qname, artifact_name):
 
 INCR_VERBOSITY_CHAR = "+"
 DECR_VERBOSITY_CHAR = "-"
-VERBOSITY_REGEX = (
-    "("
-    + "|".join([re.escape(INCR_VERBOSITY_CHAR), re.escape(DECR_VERBOSITY_CHAR)])
-    + "?)"
-)
 
 
 def configure_artifact_log(log):
@@ -489,13 +485,16 @@ def configure_artifact_log(log):
         log.propagate = True
 
 
-# match a comma separated list of loggable names (whitespace allowed after commas)
-def _gen_settings_regex():
-    return re.compile(r"((\+|-)?[\w\.]+,\s*)*(\+|-)?[\w\.]+?")
-
-
+# check for a comma separated list of loggable names, each with an
+# optional +/- verbosity prefix (whitespace allowed around commas)
 def _validate_settings(settings):
-    return re.fullmatch(_gen_settings_regex(), settings) is not None
+    for token in settings.split(","):
+        token = token.strip()
+        if token and token[0] in (INCR_VERBOSITY_CHAR, DECR_VERBOSITY_CHAR):
+            token = token[1:]
+        if not token or not all(c == "." or c == "_" or c.isalnum() for c in token):
+            return False
+    return True
 
 
 def help_message(verbose=False):
@@ -570,6 +569,17 @@ Valid settings:
     return msg
 
 
+def _get_name_level_pair(name):
+    # the verbosity prefix can only appear at the start of a token,
+    # so a single slice is enough to strip it
+    if name[0] == INCR_VERBOSITY_CHAR:
+        return name[1:], logging.DEBUG
+    elif name[0] == DECR_VERBOSITY_CHAR:
+        return name[1:], logging.ERROR
+    else:
+        return name, logging.INFO
+
+
 @functools.lru_cache
 def _parse_log_settings(settings):
     if settings == "":
@@ -585,23 +595,10 @@ def _parse_log_settings(settings):
     settings = re.sub(r"\s+", "", settings)
     log_names = settings.split(",")
 
-    def get_name_level_pair(name):
-        clean_name = name.replace(INCR_VERBOSITY_CHAR, "")
-        clean_name = clean_name.replace(DECR_VERBOSITY_CHAR, "")
-
-        if name[0] == INCR_VERBOSITY_CHAR:
-            level = logging.DEBUG
-        elif name[0] == DECR_VERBOSITY_CHAR:
-            level = logging.ERROR
-        else:
-            level = logging.INFO
-
-        return clean_name, level
-
     log_state = LogState()
 
     for name in log_names:
-        name, level = get_name_level_pair(name)
+        name, level = _get_name_level_pair(name)
 
         if name == "all":
             name = "torch"
@@ -654,8 +651,28 @@ def _has_registered_parent(log_qname):
 
 # apply custom formats to artifacts when necessary
 class TorchLogsFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__()
+        # cache of record name -> artifact name (None for non-artifact logs);
+        # avoids a logger lookup per record on hot logging paths. Safe to
+        # cache since artifact loggers get their artifact_name assigned at
+        # creation, before they can emit any records.
+        self._artifact_name_cache: Dict[str, Optional[str]] = {}
+
+    def _get_artifact_name(self, record_name):
+        cache = self._artifact_name_cache
+        try:
+            return cache[record_name]
+        except KeyError:
+            artifact_name = getattr(
+                logging.getLogger(record_name), "artifact_name", None
+            )
+            if len(cache) < 512:
+                cache[record_name] = artifact_name
+            return artifact_name
+
     def format(self, record):
-        artifact_name = getattr(logging.getLogger(record.name), "artifact_name", None)
+        artifact_name = self._get_artifact_name(record.name)
         if artifact_name is not None:
             artifact_formatter = log_registry.artifact_log_formatters.get(
                 artifact_name, None
@@ -695,6 +712,8 @@ class TorchLogsFormatter(logging.Formatter):
         return "\n".join(f"{prefix} {l}" for l in lines)
 
 
+# build the shared formatter on first use rather than at import time
+@functools.lru_cache(None)
 def _default_formatter():
     fmt = os.environ.get(LOG_FORMAT_ENV_VAR, None)
     if fmt is None:
@@ -703,12 +722,9 @@ def _default_formatter():
         return logging.Formatter(fmt)
 
 
-DEFAULT_FORMATTER = _default_formatter()
-
-
 def _setup_handlers(create_handler_fn, log):
     debug_handler = _track_handler(create_handler_fn())
-    debug_handler.setFormatter(DEFAULT_FORMATTER)
+    debug_handler.setFormatter(_default_formatter())
     debug_handler.setLevel(logging.DEBUG)
     log.addHandler(debug_handler)
 
@@ -735,16 +751,19 @@ def _clear_handlers(log):
 
 
 def _reset_logs():
-    # reset all registered logs
+    # reset all registered logs; they are set to NOTSET so that they respect
+    # their parent log level, except the top level torch log, which defaults
+    # to WARNING so that our log messages don't leak to the lower levels
     for log_qname in log_registry.get_log_qnames():
         log = logging.getLogger(log_qname)
-        log.setLevel(logging.WARNING)
+        log.setLevel(logging.WARNING if log_qname == "torch" else logging.NOTSET)
         log.propagate = False
         _clear_handlers(log)
 
-    # reset all artifact and child logs
+    # reset all artifact and child logs; iterate the registry sets directly
+    # to avoid building throwaway copies on every reset
     for artifact_log_qname in itertools.chain(
-        log_registry.get_artifact_log_qnames(), log_registry.get_child_log_qnames()
+        log_registry.artifact_log_qnames, log_registry.child_log_qnames
     ):
         log = logging.getLogger(artifact_log_qname)
         log.setLevel(logging.NOTSET)
@@ -761,20 +780,12 @@ def _set_log_state(state):
 
 
 def _init_logs(log_file_name=None):
+    # _reset_logs already put every registered logger at its default level
+    # (NOTSET, or WARNING for the top level torch log)
     _reset_logs()
     _update_log_state_from_env()
 
-    # First, reset all known (registered) loggers to NOTSET, so that they
-    # respect their parent log level
-    for log_qname in log_registry.get_log_qnames():
-        # But not the top level torch level: this defaults to WARNING so
-        # that our log messages don't leak to the lower levels
-        if log_qname == "torch":
-            continue
-        log = logging.getLogger(log_qname)
-        log.setLevel(logging.NOTSET)
-
-    # Now, for all loggers which the user requested to have non-standard
+    # For all loggers which the user requested to have non-standard
     # logging behavior, modify their log levels
     for log_qname, level in log_state.get_log_level_pairs():
         log = logging.getLogger(log_qname)
@@ -796,7 +807,7 @@ def _init_logs(log_file_name=None):
 
     # configure artifact loggers, note: this must happen last
     # since the levels of ancestor loggers are taken into account
-    for artifact_log_qname in log_registry.get_artifact_log_qnames():
+    for artifact_log_qname in log_registry.artifact_log_qnames:
         log = logging.getLogger(artifact_log_qname)
         configure_artifact_log(log)
 
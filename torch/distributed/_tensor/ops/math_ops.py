@@ -1,5 +1,6 @@
 # Copyright (c) Meta Platforms, Inc. and affiliates
-from typing import cast, List, Optional, Sequence, Tuple
+import functools
+from typing import cast, Dict, List, Optional, Sequence, Tuple
 
 import torch
 
@@ -15,6 +16,7 @@ from torch.distributed._tensor.ops.common_rules import pointwise_rule
 from torch.distributed._tensor.ops.utils import (
     as_list,
     generate_redistribute_costs,
+    normalize_dim,
     normalize_dims,
     normalize_to_torch_size,
     register_op_strategy,
@@ -32,6 +34,10 @@ from torch.distributed.device_mesh import DeviceMesh
 
 aten = torch.ops.aten
 
+# placements kept as-is when mapping over a reduction; hoisted so the hot
+# placement loops don't rebuild the isinstance tuple per element
+_REPLICATE_OR_PARTIAL = (Replicate, _Partial)
+
 
 def _infer_reduction_dims(dims_arg: object, ndim: int) -> Optional[List[int]]:
     if dims_arg is None:
@@ -44,13 +50,17 @@ def _infer_reduction_dims(dims_arg: object, ndim: int) -> Optional[List[int]]:
     return dims
 
 
+# the combinations of reduction dims/ndim seen in a program are few, so
+# memoize the map instead of rebuilding it on every strategy proposal
+@functools.lru_cache(maxsize=None)
 def _infer_reduce_dims_map(
-    reduction_dims: List[int], input_ndim: int, keep_dim=False
-) -> List[int]:
+    reduction_dims: Tuple[int, ...], input_ndim: int, keep_dim=False
+) -> Tuple[int, ...]:
+    reduction_dims_set = frozenset(reduction_dims)
     reduction_dims_map = []
     new_dim_count = 0
     for input_dim in range(input_ndim):
-        if input_dim in reduction_dims and not keep_dim:
+        if input_dim in reduction_dims_set and not keep_dim:
             # if input dim in reduction dims, mark it as -1
             reduction_dims_map.append(-1)
         else:
@@ -58,7 +68,14 @@ def _infer_reduce_dims_map(
             reduction_dims_map.append(new_dim_count)
             new_dim_count += 1
 
-    return reduction_dims_map
+    return tuple(reduction_dims_map)
+
+
+# reducing over every dim is common (e.g. aten.sum.default), so share one
+# tuple per ndim instead of rebuilding list(range(ndim)) per dispatch
+@functools.lru_cache(maxsize=None)
+def _all_reduction_dims(ndim: int) -> Tuple[int, ...]:
+    return tuple(range(ndim))
 
 
 def replicate_reduction_dims(
@@ -66,11 +83,12 @@ def replicate_reduction_dims(
 ) -> Tuple[Placement, ...]:
     # replicate the reduction dims if not reduction_linear
     new_placements: List[Placement] = []
+    reduction_dims_set = frozenset(reduction_dims)
 
     for p in placements:
         if p.is_partial():
             new_placements.append(Replicate())
-        elif isinstance(p, Shard) and p.dim in reduction_dims:
+        elif isinstance(p, Shard) and p.dim in reduction_dims_set:
             new_placements.append(Replicate())
         else:
             new_placements.append(p)
@@ -81,33 +99,78 @@ def replicate_reduction_dims(
 def map_placements_after_reduction(
     placements: Tuple[Placement, ...],
     reduction_dims: List[int],
-    reduction_dims_map: List[int],
+    reduction_dims_map: Sequence[int],
     reduction_op: c10d.ReduceOp.RedOpType,
 ) -> Tuple[Placement, ...]:
     """
     Map each placement based on the output shape after reduction.
     """
     new_placements: List[Placement] = []
+    reduction_dims_set = frozenset(reduction_dims)
     for placement in placements:
-        if isinstance(placement, (Replicate, _Partial)):
-            new_placements.append(placement)
-        else:
+        # exact type check fast-paths the common Shard case, the tuple
+        # isinstance only runs for other placement types
+        if type(placement) is Shard or not isinstance(
+            placement, _REPLICATE_OR_PARTIAL
+        ):
             assert isinstance(placement, Shard)
             shard_dim = placement.dim
             new_shard_dim = reduction_dims_map[shard_dim]
-            if new_shard_dim == -1 or shard_dim in reduction_dims:
+            if new_shard_dim == -1 or shard_dim in reduction_dims_set:
                 # if new_shard_dim collapsed or its in the reduction dims
                 # (i.e. for the case where keepdims=True), we generate partial
                 new_placements.append(_Partial(reduction_op))
             else:
                 new_placements.append(Shard(new_shard_dim))
+        else:
+            new_placements.append(placement)
     return tuple(new_placements)
 
 
+def _replicate_and_map_reduction_dims(
+    placements: Tuple[Placement, ...],
+    reduction_dims: Sequence[int],
+    reduction_dims_map: Sequence[int],
+    reduction_op: c10d.ReduceOp.RedOpType,
+    reduction_linear: bool,
+) -> Tuple[Tuple[Placement, ...], Tuple[Placement, ...]]:
+    """
+    Fused single pass of replicate_reduction_dims followed by
+    map_placements_after_reduction: produce both the input placements
+    (with pending sums and reduction-dim sharding cleared out when the
+    reduction is not linear) and the output placements after reduction,
+    without walking the placements twice.
+    """
+    input_placements: List[Placement] = []
+    out_placements: List[Placement] = []
+    reduction_dims_set = frozenset(reduction_dims)
+    for p in placements:
+        if not reduction_linear and (
+            p.is_partial() or (isinstance(p, Shard) and p.dim in reduction_dims_set)
+        ):
+            p = Replicate()
+        input_placements.append(p)
+        # exact type check fast-paths the common Shard case, the tuple
+        # isinstance only runs for other placement types
+        if type(p) is Shard or not isinstance(p, _REPLICATE_OR_PARTIAL):
+            assert isinstance(p, Shard)
+            shard_dim = p.dim
+            new_shard_dim = reduction_dims_map[shard_dim]
+            if new_shard_dim == -1 or shard_dim in reduction_dims_set:
+                # if new_shard_dim collapsed or its in the reduction dims
+                # (i.e. for the case where keepdims=True), we generate partial
+                out_placements.append(_Partial(reduction_op))
+            else:
+                out_placements.append(Shard(new_shard_dim))
+        else:
+            out_placements.append(p)
+    return tuple(input_placements), tuple(out_placements)
+
+
 def common_reduction_strategy(
     mesh: DeviceMesh,
     input_strategy: OpStrategy,
-    reduce_dims: List[int],
+    reduce_dims: Sequence[int],
     keep_dim: bool = False,
     reduction_linear: bool = True,
     reduction_op: c10d.ReduceOp.RedOpType = c10d.ReduceOp.SUM,
@@ -121,33 +184,41 @@ def common_reduction_strategy(
     # by default follow reduction input strategy
     reduction_strategy = OpStrategy([])
 
+    # every strategy of an OpStrategy shares the input ndim, so the
+    # reduce dims map is loop invariant
+    reduce_dims_map = _infer_reduce_dims_map(
+        tuple(reduce_dims), input_strategy.output_ndim, keep_dim
+    )
+
+    # different input strategies can reduce to the same output placements,
+    # so share a single output spec per distinct placements in this dispatch
+    output_specs: Dict[Tuple[Placement, ...], DTensorSpec] = {}
+
     for strtg in input_strategy.strategies:
-        if not reduction_linear:
-            # input placements for this strategy should clear out pending sum and sharding
-            # on the reduction dimension
-            input_placements = replicate_reduction_dims(
-                strtg.output_spec.placements, reduce_dims
-            )
-        else:
-            input_placements = strtg.output_spec.placements
+        input_placements, out_placements = _replicate_and_map_reduction_dims(
+            strtg.output_spec.placements,
+            reduce_dims,
+            reduce_dims_map,
+            reduction_op,
+            reduction_linear,
+        )
 
         input_spec = DTensorSpec(
             mesh=mesh,
             placements=input_placements,
             tensor_meta=strtg.output_spec.tensor_meta,
         )
-
-        reduce_dims_map = _infer_reduce_dims_map(reduce_dims, input_spec.ndim, keep_dim)
-        out_placements = map_placements_after_reduction(
-            input_spec.placements, reduce_dims, reduce_dims_map, reduction_op
-        )
         redistribute_cost = [generate_redistribute_costs(input_strategy, input_spec)]
+        output_spec = output_specs.get(out_placements)
+        if output_spec is None:
+            output_spec = DTensorSpec(
+                mesh=mesh,
+                placements=out_placements,
+            )
+            output_specs[out_placements] = output_spec
         reduction_strategy.strategies.append(
             PlacementStrategy(
-                output_spec=DTensorSpec(
-                    mesh=mesh,
-                    placements=out_placements,
-                ),
+                output_spec=output_spec,
                 input_specs=(input_spec,),
                 redistribute_cost=redistribute_cost,
             )
@@ -175,10 +246,10 @@ LINEAR_REDUCTION_OP_MAP = {
     aten.min.out: c10d.ReduceOp.MIN,
 }
 
+LINEAR_REDUCTION_OPS = list(LINEAR_REDUCTION_OP_MAP.keys())
 
-@register_op_strategy(
-    list(LINEAR_REDUCTION_OP_MAP.keys()), schema_info=RuntimeSchemaInfo(1)
-)
+
+@register_op_strategy(LINEAR_REDUCTION_OPS, schema_info=RuntimeSchemaInfo(1))
 def linear_reduction_strategy(mesh: DeviceMesh, op_schema: OpSchema) -> OpStrategy:
     args_schema = op_schema.args_schema
     input_strategy = args_schema[0]
@@ -187,7 +258,9 @@ def linear_reduction_strategy(mesh: DeviceMesh, op_schema: OpSchema) -> OpStrate
     if len(op_schema.args_schema) > 1:
         dims = _infer_reduction_dims(args_schema[1], input_strategy.output_ndim)
 
-    reduce_dims = list(range(input_strategy.output_ndim)) if dims is None else dims
+    reduce_dims = (
+        _all_reduction_dims(input_strategy.output_ndim) if dims is None else dims
+    )
 
     keep_dim = len(op_schema.args_schema) > 2 and bool(op_schema.args_schema[2])
     reduction_op = LINEAR_REDUCTION_OP_MAP[op_schema.op]
@@ -213,7 +286,9 @@ def var_reduction_strategy(mesh: DeviceMesh, op_schema: OpSchema) -> OpStrategy:
     if len(op_schema.args_schema) > 1:
         dims = _infer_reduction_dims(args_schema[1], input_strategy.output_ndim)
 
-    reduce_dims = list(range(input_strategy.output_ndim)) if dims is None else dims
+    reduce_dims = (
+        _all_reduction_dims(input_strategy.output_ndim) if dims is None else dims
+    )
 
     keep_dim = cast(bool, op_schema.kwargs_schema.get("keepdim", False))
     return common_reduction_strategy(
@@ -221,15 +296,19 @@ def var_reduction_strategy(mesh: DeviceMesh, op_schema: OpSchema) -> OpStrategy:
     )
 
 
+def _is_sharded_on_dim(spec: DTensorSpec, dim: int) -> bool:
+    # cheaper than materializing spec.dim_map just to test one tensor dim
+    return any(isinstance(p, Shard) and p.dim == dim for p in spec.placements)
+
+
 @register_prop_rule(
     [aten._log_softmax.default, aten._softmax.default], schema_info=RuntimeSchemaInfo(1)
 )
 def softmax_rule(op_schema: OpSchema) -> OutputSharding:
     input_spec, softmax_dim, _ = op_schema.args_schema
     input_spec = cast(DTensorSpec, input_spec)
-    softmax_dim = cast(int, softmax_dim)
-    dim_map = input_spec.dim_map
-    if softmax_dim < len(dim_map) and dim_map[softmax_dim] >= 0:
+    softmax_dim = normalize_dim(cast(int, softmax_dim), input_spec.ndim)
+    if softmax_dim < input_spec.ndim and _is_sharded_on_dim(input_spec, softmax_dim):
         raise RuntimeError("Cannot run softmax on sharding dimension!")
     return OutputSharding(input_spec)
 
@@ -245,11 +324,10 @@ def softmax_bwd_rule(op_schema: OpSchema) -> OutputSharding:
     grad_out_spec, out_spec, softmax_dim, _ = op_schema.args_schema
     grad_out_spec = cast(DTensorSpec, grad_out_spec)
     out_spec = cast(DTensorSpec, out_spec)
-    softmax_dim = cast(int, softmax_dim)
-    grad_out_dim_map = grad_out_spec.dim_map
-    out_dim_map = out_spec.dim_map
-    if softmax_dim < len(grad_out_dim_map) and (
-        grad_out_dim_map[softmax_dim] >= 0 or out_dim_map[softmax_dim] >= 0
+    softmax_dim = normalize_dim(cast(int, softmax_dim), grad_out_spec.ndim)
+    if softmax_dim < grad_out_spec.ndim and (
+        _is_sharded_on_dim(grad_out_spec, softmax_dim)
+        or _is_sharded_on_dim(out_spec, softmax_dim)
     ):
         raise RuntimeError("Cannot run _softmax_backward_data on sharding dimension!")
     return pointwise_rule(op_schema)